@@ -13,7 +13,7 @@ from pathlib import Path
 import re
 import sqlite3
 import sys
-from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set, Tuple
 
 import aiosqlite
 import dateutil.parser
@@ -149,6 +149,9 @@ class MetadataCache(AbstractCache):
         );
     """
 
+    # Stay below SQLite default limit on the number of query parameters
+    BATCH_SIZE = 500
+
     async def get(self, swhid: CoreSWHID, typify: bool = True) -> Any:
         cursor = await self.conn.execute(
             "select metadata from metadata_cache where swhid=?", (str(swhid),)
@@ -164,6 +167,22 @@ class MetadataCache(AbstractCache):
         else:
             return None
 
+    async def get_cached_subset(self, swhids: List[CoreSWHID]) -> Set[CoreSWHID]:
+        """Return which of the given SWHIDs are already cached, using one query
+        per chunk of SWHIDs instead of one query per SWHID"""
+
+        cached = set()
+        for i in range(0, len(swhids), self.BATCH_SIZE):
+            chunk = {str(swhid): swhid for swhid in swhids[i : i + self.BATCH_SIZE]}
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = await self.conn.execute(
+                f"select swhid from metadata_cache where swhid in ({placeholders})",
+                tuple(chunk),
+            )
+            for row in await cursor.fetchall():
+                cached.add(chunk[row[0]])
+        return cached
+
     async def get_visits(self, url_encoded: str) -> Optional[List[Dict[str, Any]]]:
         cursor = await self.conn.execute(
             "select metadata, itime from visits_cache where url=?",
@@ -284,6 +303,10 @@ class HistoryCache(AbstractCache):
         select * from dfs limit -1 offset 1
     """
 
+    HISTORY_PAGE_QUERY = f"""
+        select * from ( {HISTORY_REC_QUERY} ) as history limit ? offset ?
+    """
+
     async def get(self, swhid: CoreSWHID) -> Optional[List[CoreSWHID]]:
         cursor = await self.conn.execute(
             self.HISTORY_REC_QUERY,
@@ -301,6 +324,26 @@ class HistoryCache(AbstractCache):
                 logging.warning("Cannot parse object from history cache: %s", parent)
         return history
 
+    async def get_page(
+        self, swhid: CoreSWHID, offset: int, limit: int
+    ) -> List[CoreSWHID]:
+        """Same as `get` but only return `limit` ancestors starting at `offset`,
+        without loading the full history"""
+
+        cursor = await self.conn.execute(
+            self.HISTORY_PAGE_QUERY,
+            (str(swhid), limit, offset),
+        )
+        cache = await cursor.fetchall()
+        history = []
+        for row in cache:
+            parent = row[0]
+            try:
+                history.append(CoreSWHID.from_string(parent))
+            except ValidationError:
+                logging.warning("Cannot parse object from history cache: %s", parent)
+        return history
+
     async def get_with_date_prefix(
         self, swhid: CoreSWHID, date_prefix: str
     ) -> List[Tuple[CoreSWHID, str]]:
@@ -4,13 +4,16 @@
 # See top-level LICENSE file for more information
 
 import asyncio
+import bisect
 from dataclasses import dataclass, field
+from functools import lru_cache
 import json
 import logging
+from operator import attrgetter
 import os
 from pathlib import Path
 import re
-from typing import Any, AsyncIterator, Dict, List, Optional, cast
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, cast
 
 from swh.fuse.fs.entry import (
     EntryMode,
@@ -20,11 +23,26 @@ from swh.fuse.fs.entry import (
     FuseSymlinkEntry,
 )
 from swh.model.from_disk import DentryPerms
-from swh.model.hashutil import hash_to_bytes, hash_to_hex
+from swh.model.hashutil import hash_to_hex
 from swh.model.swhids import CoreSWHID, ObjectType
 
 SWHID_REGEXP = r"swh:1:(cnt|dir|rel|rev|snp):[0-9a-f]{40}"
 
+# Convert enum members once instead of on every created entry
+_RDONLY_DIR = int(EntryMode.RDONLY_DIR)
+_RDONLY_FILE = int(EntryMode.RDONLY_FILE)
+_SYMLINK_PERMS = int(DentryPerms.symlink)
+
+
+@lru_cache(maxsize=100_000)
+def _archive_target(root_path: str, swhid: CoreSWHID) -> str:
+    """Return the symlink target pointing to a SWHID in `archive/`, given the
+    relative root path of the symlink. The same SWHIDs are linked from many
+    virtual directories at the same depth (e.g., the by-hash/ and by-page/
+    history shardings), hence the memoization."""
+
+    return f"{root_path}archive/{swhid}"
+
 
 @dataclass
 class Content(FuseFileEntry):
@@ -39,18 +57,18 @@ class Content(FuseFileEntry):
     not meaningful (e.g., `0x644`)."""
 
     swhid: CoreSWHID
-    prefetch: Any = None
-    """optional prefetched metadata used to set entry attributes"""
+    length: Optional[int] = None
+    """optional prefetched size used to set entry attributes"""
 
     async def get_content(self) -> bytes:
         data = await self.fuse.get_blob(self.swhid)
-        if not self.prefetch:
-            self.prefetch = {"length": len(data)}
+        if self.length is None:
+            self.length = len(data)
         return data
 
     async def size(self) -> int:
-        if self.prefetch:
-            return self.prefetch["length"]
+        if self.length is not None:
+            return self.length
         else:
             return await super().size()
 
@@ -72,30 +90,65 @@ class Directory(FuseDirEntry):
 
     async def compute_entries(self) -> AsyncIterator[FuseEntry]:
         metadata = await self.fuse.get_metadata(self.swhid)
+
+        # First pass: classify entries so that the extra API calls needed by
+        # symlinks and submodules can be issued concurrently
+        entries = []
+        symlinks = []
+        submodules = []
         for entry in metadata:
-            name = entry["name"]
             swhid = entry["target"]
             mode = (
                 # Archived permissions for directories are always set to
                 # 0o040000 so use a read-only permission instead
-                int(EntryMode.RDONLY_DIR)
+                _RDONLY_DIR
                 if swhid.object_type == ObjectType.DIRECTORY
                 else entry["perms"]
             )
+            entries.append((entry, mode))
 
-            # 1. Symlink (check symlink first because condition is less restrictive)
-            if mode == DentryPerms.symlink:
-                target = b""
-                try:
-                    # Symlink target is stored in the blob content
-                    target = await self.fuse.get_blob(swhid)
-                except Exception:
-                    pass  # Ignore error and create a (broken) symlink anyway
+            # Check symlink first because condition is less restrictive
+            if mode == _SYMLINK_PERMS:
+                symlinks.append(swhid)
+            elif swhid.object_type == ObjectType.REVISION:
+                submodules.append(swhid)
+
+        # Symlinks with the same target share the same blob (and submodules the
+        # same revision), so only fetch each SWHID once
+        symlinks = list(dict.fromkeys(symlinks))
+        submodules = list(dict.fromkeys(submodules))
+
+        # Symlink target is stored in the blob content, and submodule revision
+        # metadata is fetched to distinguish it with regular directories. Ignore
+        # errors and create (broken) symlinks anyway.
+        symlink_blobs, _ = await asyncio.gather(
+            asyncio.gather(
+                *(self.fuse.get_blob(swhid) for swhid in symlinks),
+                return_exceptions=True,
+            ),
+            asyncio.gather(
+                *(self.fuse.get_metadata(swhid) for swhid in submodules),
+                return_exceptions=True,
+            ),
+        )
+        symlink_targets = {
+            # Also catch cancellation errors, which are not Exception subclasses
+            swhid: b"" if isinstance(blob, BaseException) else blob
+            for swhid, blob in zip(symlinks, symlink_blobs)
+        }
 
+        # Second pass: create the entries using the prefetched data
+        root_path = self.get_relative_root_path()
+        for entry, mode in entries:
+            name = entry["name"]
+            swhid = entry["target"]
+
+            # 1. Symlink
+            if mode == _SYMLINK_PERMS:
                 yield self.create_child(
                     FuseSymlinkEntry,
                     name=name,
-                    target=target,
+                    target=symlink_targets[swhid],
                 )
             # 2. Regular file
             elif swhid.object_type == ObjectType.CONTENT:
@@ -106,7 +159,7 @@ class Directory(FuseDirEntry):
                     swhid=swhid,
                     # The directory API has extra info we can use to set
                     # attributes without additional Software Heritage API call
-                    prefetch=entry,
+                    length=entry["length"],
                 )
             # 3. Regular directory
             elif swhid.object_type == ObjectType.DIRECTORY:
@@ -118,17 +171,10 @@ class Directory(FuseDirEntry):
                 )
             # 4. Submodule
             elif swhid.object_type == ObjectType.REVISION:
-                try:
-                    # Make sure the revision metadata is fetched and create a
-                    # symlink to distinguish it with regular directories
-                    await self.fuse.get_metadata(swhid)
-                except Exception:
-                    pass  # Ignore error and create a (broken) symlink anyway
-
                 yield self.create_child(
                     FuseSymlinkEntry,
                     name=name,
-                    target=Path(self.get_relative_root_path(), f"archive/{swhid}"),
+                    target=_archive_target(root_path, swhid),
                 )
             else:
                 raise ValueError("Unknown directory entry type: {swhid.object_type}")
@@ -168,7 +214,7 @@ class Revision(FuseDirEntry):
         yield self.create_child(
             FuseSymlinkEntry,
             name="root",
-            target=Path(root_path, f"archive/{directory}"),
+            target=_archive_target(root_path, directory),
         )
         yield self.create_child(
             FuseSymlinkEntry,
@@ -178,7 +224,7 @@ class Revision(FuseDirEntry):
         yield self.create_child(
             RevisionParents,
             name="parents",
-            mode=int(EntryMode.RDONLY_DIR),
+            mode=_RDONLY_DIR,
             parents=[x["id"] for x in parents],
         )
 
@@ -192,7 +238,7 @@ class Revision(FuseDirEntry):
         yield self.create_child(
             RevisionHistory,
             name="history",
-            mode=int(EntryMode.RDONLY_DIR),
+            mode=_RDONLY_DIR,
             swhid=self.swhid,
         )
 
@@ -209,7 +255,7 @@ class RevisionParents(FuseDirEntry):
             yield self.create_child(
                 FuseSymlinkEntry,
                 name=str(i + 1),
-                target=Path(root_path, f"archive/{parent}"),
+                target=_archive_target(root_path, parent),
             )
 
 
@@ -219,20 +265,45 @@ class RevisionHistory(FuseDirEntry):
 
     swhid: CoreSWHID
 
+    PREFETCH_WORKERS = 64
+
     async def prefill_by_date_cache(self, by_date_dir: FuseDirEntry) -> None:
         history = await self.fuse.get_history(self.swhid)
+        cached = await self.fuse.cache.metadata.get_cached_subset(history)
+        missing = (swhid for swhid in history if swhid not in cached)
         nb_api_calls = 0
-        for swhid in history:
-            cache = await self.fuse.cache.metadata.get(swhid)
-            if cache:
-                continue
 
-            await self.fuse.get_metadata(swhid)
-            # The by-date/ directory is cached temporarily in direntry, and
-            # invalidated + updated every 100 API calls
-            nb_api_calls += 1
-            if nb_api_calls % 100 == 0:
-                self.fuse.cache.direntry.invalidate(by_date_dir)
+        async def prefill_worker() -> None:
+            nonlocal nb_api_calls
+
+            # All workers share the same iterator, so each SWHID is only
+            # prefetched once
+            for swhid in missing:
+                try:
+                    # The semaphore is shared by all the prefetching history/
+                    # directories to bound the total number of API calls
+                    async with self.fuse.prefetch_sem:
+                        await self.fuse.get_metadata(swhid)
+                except asyncio.CancelledError:
+                    # Python 3.7 CancelledError is an Exception subclass, make sure
+                    # cancellation (e.g., on unmount) still stops the worker
+                    raise
+                except Exception as err:
+                    # A failed prefetch should not prevent prefetching the rest
+                    # of the history
+                    self.fuse.logger.debug("Cannot prefetch %s: %s", swhid, err)
+                    continue
+
+                # The by-date/ directory is cached temporarily in direntry, and
+                # invalidated + updated every 100 API calls
+                nb_api_calls += 1
+                if nb_api_calls % 100 == 0:
+                    self.fuse.cache.direntry.invalidate(by_date_dir)
+
+        # The Web API has no bulk metadata endpoint, so overlap the requests
+        # using a fixed number of workers (instead of one task per SWHID, which
+        # would not scale with large histories)
+        await asyncio.gather(*(prefill_worker() for _ in range(self.PREFETCH_WORKERS)))
         # Make sure to have the latest entries once the prefilling is done
         self.fuse.cache.direntry.invalidate(by_date_dir)
 
@@ -242,27 +313,27 @@ class RevisionHistory(FuseDirEntry):
             self.create_child(
                 RevisionHistoryShardByDate,
                 name="by-date",
-                mode=int(EntryMode.RDONLY_DIR),
+                mode=_RDONLY_DIR,
                 history_swhid=self.swhid,
             ),
         )
 
         # Run it concurrently because of the many API calls necessary
-        asyncio.create_task(self.prefill_by_date_cache(by_date_dir))
+        self.fuse.create_background_task(self.prefill_by_date_cache(by_date_dir))
 
         yield by_date_dir
 
         yield self.create_child(
             RevisionHistoryShardByHash,
             name="by-hash",
-            mode=int(EntryMode.RDONLY_DIR),
+            mode=_RDONLY_DIR,
             history_swhid=self.swhid,
         )
 
         yield self.create_child(
             RevisionHistoryShardByPage,
             name="by-page",
-            mode=int(EntryMode.RDONLY_DIR),
+            mode=_RDONLY_DIR,
             history_swhid=self.swhid,
         )
 
@@ -283,7 +354,7 @@ class RevisionHistoryShardByDate(FuseDirEntry):
         """Temporary file used to indicate loading progress in by-date/"""
 
         name: str = field(init=False, default=".status")
-        mode: int = field(init=False, default=int(EntryMode.RDONLY_FILE))
+        mode: int = field(init=False, default=_RDONLY_FILE)
         history_swhid: CoreSWHID
 
         def __post_init__(self):
@@ -317,6 +388,7 @@ class RevisionHistoryShardByDate(FuseDirEntry):
         )
 
         depth = self.prefix.count("/")
+        prefix_len = len(self.prefix)
         root_path = self.get_relative_root_path()
         sharded_dirs = set()
 
@@ -328,17 +400,21 @@ class RevisionHistoryShardByDate(FuseDirEntry):
                 yield self.create_child(
                     FuseSymlinkEntry,
                     name=str(swhid),
-                    target=Path(root_path, f"archive/{swhid}"),
+                    target=_archive_target(root_path, swhid),
                 )
             # Create sharded directories
             else:
-                next_prefix = sharded_name.split("/")[depth]
+                # Only slice the next date component (sharded names always end
+                # with a slash) instead of splitting the full sharded name
+                next_prefix = sharded_name[
+                    prefix_len : sharded_name.index("/", prefix_len)
+                ]
                 if next_prefix not in sharded_dirs:
                     sharded_dirs.add(next_prefix)
                     yield self.create_child(
                         RevisionHistoryShardByDate,
                         name=next_prefix,
-                        mode=int(EntryMode.RDONLY_DIR),
+                        mode=_RDONLY_DIR,
                         prefix=f"{self.prefix}{next_prefix}/",
                         history_swhid=self.history_swhid,
                     )
@@ -356,36 +432,52 @@ class RevisionHistoryShardByHash(FuseDirEntry):
 
     history_swhid: CoreSWHID
     prefix: str = field(default="")
+    sorted_history: Tuple[CoreSWHID, ...] = field(default=())
+    """full history sorted by object id, shared by all sharded directories"""
+    start: int = field(default=0)
+    end: int = field(default=0)
+    """range of `sorted_history` entries matching the prefix"""
 
     SHARDING_LENGTH = 2
     ENTRIES_REGEXP = re.compile(r"^([a-f0-9]+)|(" + SWHID_REGEXP + ")$")
 
     async def compute_entries(self) -> AsyncIterator[FuseEntry]:
-        history = await self.fuse.get_history(self.history_swhid)
-
         if self.prefix:
             root_path = self.get_relative_root_path()
-            for swhid in history:
-                if swhid.object_id.startswith(hash_to_bytes(self.prefix)):
-                    yield self.create_child(
-                        FuseSymlinkEntry,
-                        name=str(swhid),
-                        target=Path(root_path, f"archive/{swhid}"),
-                    )
+            for i in range(self.start, self.end):
+                swhid = self.sorted_history[i]
+                yield self.create_child(
+                    FuseSymlinkEntry,
+                    name=str(swhid),
+                    target=_archive_target(root_path, swhid),
+                )
         # Create sharded directories
         else:
-            sharded_dirs = set()
-            for swhid in history:
-                next_prefix = hash_to_hex(swhid.object_id)[: self.SHARDING_LENGTH]
-                if next_prefix not in sharded_dirs:
-                    sharded_dirs.add(next_prefix)
-                    yield self.create_child(
-                        RevisionHistoryShardByHash,
-                        name=next_prefix,
-                        mode=int(EntryMode.RDONLY_DIR),
-                        prefix=next_prefix,
-                        history_swhid=self.history_swhid,
-                    )
+            # Sort the history once, so that each sharded directory only needs a
+            # range of it instead of its own list of entries
+            history = await self.fuse.get_history(self.history_swhid)
+            sorted_history = tuple(sorted(history, key=attrgetter("object_id")))
+            object_ids = [swhid.object_id for swhid in sorted_history]
+            nb_bytes = self.SHARDING_LENGTH // 2
+
+            start = 0
+            while start < len(object_ids):
+                prefix = object_ids[start][:nb_bytes]
+                # Upper bound of all object ids starting with the prefix
+                last_id = prefix + b"\xff" * (len(object_ids[start]) - nb_bytes)
+                end = bisect.bisect_right(object_ids, last_id, start)
+                next_prefix = hash_to_hex(prefix)
+                yield self.create_child(
+                    RevisionHistoryShardByHash,
+                    name=next_prefix,
+                    mode=_RDONLY_DIR,
+                    prefix=next_prefix,
+                    history_swhid=self.history_swhid,
+                    sorted_history=sorted_history,
+                    start=start,
+                    end=end,
+                )
+                start = end
 
 
 @dataclass
@@ -400,27 +492,30 @@ class RevisionHistoryShardByPage(FuseDirEntry):
     ENTRIES_REGEXP = re.compile(r"^([0-9]+)|(" + SWHID_REGEXP + ")$")
 
     async def compute_entries(self) -> AsyncIterator[FuseEntry]:
-        history = await self.fuse.get_history(self.history_swhid)
-
         if self.prefix is not None:
             current_page = self.prefix
             root_path = self.get_relative_root_path()
-            max_idx = min(len(history), (current_page + 1) * self.PAGE_SIZE)
-            for i in range(current_page * self.PAGE_SIZE, max_idx):
-                swhid = history[i]
+            # Only read the current page from the history cache
+            history = await self.fuse.get_history_page(
+                self.history_swhid,
+                offset=current_page * self.PAGE_SIZE,
+                limit=self.PAGE_SIZE,
+            )
+            for swhid in history:
                 yield self.create_child(
                     FuseSymlinkEntry,
                     name=str(swhid),
-                    target=Path(root_path, f"archive/{swhid}"),
+                    target=_archive_target(root_path, swhid),
                 )
         # Create sharded directories
         else:
+            history = await self.fuse.get_history(self.history_swhid)
             for i in range(0, len(history), self.PAGE_SIZE):
                 page_number = i // self.PAGE_SIZE
                 yield self.create_child(
                     RevisionHistoryShardByPage,
                     name=self.PAGE_FMT.format(page_number=page_number),
-                    mode=int(EntryMode.RDONLY_DIR),
+                    mode=_RDONLY_DIR,
                     history_swhid=self.history_swhid,
                     prefix=page_number,
                 )
@@ -467,12 +562,12 @@ class Release(FuseDirEntry):
 
         target = metadata["target"]
         yield self.create_child(
-            FuseSymlinkEntry, name="target", target=Path(root_path, f"archive/{target}")
+            FuseSymlinkEntry, name="target", target=_archive_target(root_path, target)
         )
         yield self.create_child(
             ReleaseType,
             name="target_type",
-            mode=int(EntryMode.RDONLY_FILE),
+            mode=_RDONLY_FILE,
             target_type=target.object_type,
         )
 
@@ -481,7 +576,7 @@ class Release(FuseDirEntry):
             yield self.create_child(
                 FuseSymlinkEntry,
                 name="root",
-                target=Path(root_path, f"archive/{target_dir}"),
+                target=_archive_target(root_path, target_dir),
             )
 
 
@@ -512,15 +607,16 @@ class Snapshot(FuseDirEntry):
         metadata = await self.fuse.get_metadata(self.swhid)
         root_path = self.get_relative_root_path()
 
+        prefix_len = len(self.prefix)
         subdirs = set()
         for branch_name, branch_meta in metadata.items():
             if not branch_name.startswith(self.prefix):
                 continue
 
-            next_subdirs = branch_name[len(self.prefix) :].split("/")
-            next_prefix = next_subdirs[0]
+            # Only the next path component is needed, do not split the full name
+            next_prefix, has_subdirs, _ = branch_name[prefix_len:].partition("/")
 
-            if len(next_subdirs) == 1:
+            if not has_subdirs:
                 # Non-alias targets are symlinks to their corresponding archived
                 # artifact, whereas alias targets are relative symlinks to the
                 # corresponding snapshot directory entry.
@@ -530,12 +626,12 @@ class Snapshot(FuseDirEntry):
                     prefix = Path(branch_name).parent
                     target = os.path.relpath(target_raw, prefix)
                 else:
-                    target = f"{root_path}/archive/{target_raw}"
+                    target = _archive_target(root_path, target_raw)
 
                 yield self.create_child(
                     FuseSymlinkEntry,
                     name=next_prefix,
-                    target=Path(target),
+                    target=target,
                 )
             else:
                 subdirs.add(next_prefix)
@@ -544,7 +640,7 @@ class Snapshot(FuseDirEntry):
             yield self.create_child(
                 Snapshot,
                 name=subdir,
-                mode=int(EntryMode.RDONLY_DIR),
+                mode=_RDONLY_DIR,
                 swhid=self.swhid,
                 prefix=f"{self.prefix}{subdir}/",
             )
@@ -584,7 +680,7 @@ class Origin(FuseDirEntry):
                 yield self.create_child(
                     OriginVisit,
                     name=name,
-                    mode=int(EntryMode.RDONLY_DIR),
+                    mode=_RDONLY_DIR,
                     meta=visit,
                 )
 
@@ -609,13 +705,13 @@ class OriginVisit(FuseDirEntry):
             yield self.create_child(
                 FuseSymlinkEntry,
                 name="snapshot",
-                target=Path(root_path, f"archive/{snapshot_swhid}"),
+                target=_archive_target(root_path, snapshot_swhid),
             )
 
         yield self.create_child(
             OriginVisit.MetaFile,
             name="meta.json",
-            mode=int(EntryMode.RDONLY_FILE),
+            mode=_RDONLY_FILE,
             content=json.dumps(
                 self.meta,
                 indent=self.fuse.conf["json-indent"],
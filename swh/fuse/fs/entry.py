@@ -46,12 +46,9 @@ class FuseEntry:
     """internal reference to the main FUSE class"""
     inode: int = field(init=False)
     """unique integer identifying the entry"""
-    file_info_attrs: Dict[str, Any] = field(init=False, default_factory=dict)
 
     def __post_init__(self):
         self.inode = self.fuse._alloc_inode(self)
-        # By default, let the kernel cache previously accessed data
-        self.file_info_attrs["keep_cache"] = True
 
     async def size(self) -> int:
         """Return the size (in bytes) of an entry"""
@@ -72,6 +69,15 @@ class FuseEntry:
 class FuseFileEntry(FuseEntry):
     """FUSE virtual file entry"""
 
+    # Only regular files are open()-ed, so keep the file info attributes out of
+    # directory and symlink entries (which can be numerous, e.g., in history/)
+    file_info_attrs: Dict[str, Any] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        super().__post_init__()
+        # By default, let the kernel cache previously accessed data
+        self.file_info_attrs["keep_cache"] = True
+
     async def get_content(self) -> bytes:
         """Return the content of a file entry"""
 
@@ -9,8 +9,9 @@ import functools
 import logging
 import os
 from pathlib import Path
+import stat
 import time
-from typing import Any, Dict, List
+from typing import Any, Coroutine, Dict, List, Set
 import urllib.parse
 
 import pyfuse3
@@ -50,8 +51,38 @@ class Fuse(pyfuse3.Operations):
         )
         self.cache = cache
 
-    def shutdown(self) -> None:
-        pass
+        # Bound the number of concurrent background prefetching API calls, shared
+        # by all the history/ directories being prefetched
+        self.prefetch_sem = asyncio.Semaphore(64)
+        # Metadata API calls currently in progress, so that concurrent requests
+        # for the same SWHID are coalesced into a single API call
+        self._metadata_tasks: Dict[CoreSWHID, asyncio.Task] = {}
+        # Background tasks (e.g., history prefetching) still running, so they can
+        # be cancelled when the filesystem is unmounted
+        self.background_tasks: Set[asyncio.Task] = set()
+
+    async def shutdown(self) -> None:
+        # Shared metadata API calls are shielded from their callers'
+        # cancellation, so cancel them explicitly as well
+        tasks = [*self.background_tasks, *self._metadata_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        # Wait for the tasks to be cancelled before the caches get closed
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def create_background_task(self, coro: Coroutine) -> asyncio.Task:
+        """Run a coroutine concurrently, bound to the filesystem lifetime"""
+
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+        return task
+
+    def _background_task_done(self, task: asyncio.Task) -> None:
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            err = task.exception()
+            self.logger.error("Background task failed: %s", err, exc_info=err)
 
     def _alloc_inode(self, entry: FuseEntry) -> int:
         """Return a unique inode integer for a given entry"""
@@ -88,6 +119,23 @@ class Fuse(pyfuse3.Operations):
         if cache:
             return cache
 
+        task = self._metadata_tasks.get(swhid)
+        if task is None:
+            task = asyncio.create_task(self._fetch_metadata(swhid))
+            self._metadata_tasks[swhid] = task
+            task.add_done_callback(functools.partial(self._metadata_task_done, swhid))
+        # Do not cancel the shared API call if only one of its callers is cancelled
+        return await asyncio.shield(task)
+
+    def _metadata_task_done(self, swhid: CoreSWHID, task: asyncio.Task) -> None:
+        self._metadata_tasks.pop(swhid, None)
+        # The shared task may outlive all its (cancelled) callers, so retrieve the
+        # exception here to avoid asyncio warning that it was never retrieved.
+        # The error is already logged by _fetch_metadata.
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch_metadata(self, swhid: CoreSWHID) -> Any:
         try:
             typify = False  # Get the raw JSON from the API
             # TODO: async web API
@@ -157,6 +205,25 @@ class Fuse(pyfuse3.Operations):
             # an empty list.
             return []
 
+    async def get_history_page(
+        self, swhid: CoreSWHID, offset: int, limit: int
+    ) -> List[CoreSWHID]:
+        """Retrieve `limit` ancestors of a revision's history starting at
+        `offset`, without loading the full history from the cache"""
+
+        if swhid.object_type != ObjectType.REVISION:
+            raise pyfuse3.FUSEError(errno.EINVAL)
+
+        page = await self.cache.history.get_page(swhid, offset, limit)
+        if page:
+            return page
+
+        # Either the history is not cached yet or the offset is out of range:
+        # make sure the history is cached before retrying
+        if not await self.get_history(swhid):
+            return []
+        return await self.cache.history.get_page(swhid, offset, limit)
+
     async def get_visits(self, url_encoded: str) -> List[Dict[str, Any]]:
         """Retrieve origin visits given an encoded-URL using Software Heritage API"""
 
@@ -210,6 +277,8 @@ class Fuse(pyfuse3.Operations):
         attrs.st_uid = self.uid
         attrs.st_ino = entry.inode
         attrs.st_mode = entry.mode
+        # Directories are linked from their parent and from their own `.` entry
+        attrs.st_nlink = 2 if stat.S_ISDIR(entry.mode) else 1
         attrs.st_size = await entry.size()
         return attrs
 
@@ -243,6 +312,9 @@ class Fuse(pyfuse3.Operations):
         try:
             async for entry in direntry.get_entries(offset):
                 name = os.fsencode(entry.name)
+                # pyfuse3 replies in readdirplus mode: attributes are sent along
+                # with each entry name and cached by the kernel, which avoids
+                # an extra getattr() upcall per entry on `ls -l`
                 attrs = await self.get_attrs(entry)
                 if not pyfuse3.readdir_reply(token, name, attrs, next_id):
                     break
@@ -261,6 +333,7 @@ class Fuse(pyfuse3.Operations):
         # Re-use inode as file handle
         self.logger.debug("open(inode=%d)", inode)
         entry = self.inode2entry(inode)
+        assert isinstance(entry, FuseFileEntry)
         return pyfuse3.FileInfo(fh=inode, **entry.file_info_attrs)
 
     async def read(self, fh: int, offset: int, length: int) -> bytes:
@@ -359,5 +432,5 @@ async def main(swhids: List[CoreSWHID], root_path: Path, conf: Dict[str, Any]) -
         except Exception as err:
             fs.logger.error("Error running FUSE: %s", err)
         finally:
-            fs.shutdown()
+            await fs.shutdown()
             pyfuse3.close(unmount=True)
@@ -3,6 +3,7 @@
 # License: GNU General Public License version 3, or any later version
 # See top-level LICENSE file for more information
 
+import asyncio
 import json
 from multiprocessing import Process
 import os
@@ -14,7 +15,9 @@ from click.testing import CliRunner
 import pytest
 import yaml
 
+from swh.fuse.cache import FuseCache
 import swh.fuse.cli as cli
+from swh.fuse.fuse import Fuse
 from swh.fuse.tests.data.api_data import API_URL, MOCK_ARCHIVE
 
 
@@ -35,18 +38,42 @@ def web_api_mock(requests_mock):
 
 
 @pytest.fixture
-def fuse_mntdir(web_api_mock):
-    tmpdir = TemporaryDirectory(suffix=".swh-fuse-test")
-
-    config = {
+def fuse_config():
+    return {
         "cache": {
             "metadata": {"in-memory": True},
             "blob": {"in-memory": True},
+            "direntry": {"maxram": "10%"},
         },
         "web-api": {"url": API_URL, "auth-token": None},
         "json-indent": None,
     }
 
+
+@pytest.fixture
+def run_with_fuse(fuse_config):
+    """Run a coroutine function in-process (without mounting), given the `Fuse`
+    instance as argument, and return its result"""
+
+    def run(func):
+        async def main():
+            async with FuseCache(fuse_config["cache"]) as cache:
+                fs = Fuse(Path(), cache, fuse_config)
+                try:
+                    return await func(fs)
+                finally:
+                    await fs.shutdown()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def fuse_mntdir(web_api_mock, fuse_config):
+    tmpdir = TemporaryDirectory(suffix=".swh-fuse-test")
+    config = fuse_config
+
     # Run FUSE in foreground mode but in a separate process, so it does not
     # block execution and remains easy to kill during teardown
     def fuse_process(mntdir: Path):
@@ -3232,6 +3232,37 @@ MOCK_ARCHIVE: Dict[str, Any] = {
             },
         }
     },
+    "directory/0000000000000000000000000000000000000000/": [
+        {
+            "dir_id": "0000000000000000000000000000000000000000",
+            "type": "file",
+            "target": "61d3c9e1157203f0c4ed5165608d92294eaca808",
+            "name": "README.md",
+            "perms": 33188,
+            "status": "visible",
+            "length": None,
+        }
+    ],
+    "directory/0000000000000000000000000000000000000001/": [
+        {
+            "dir_id": "0000000000000000000000000000000000000001",
+            "type": "file",
+            "target": "76219eb72e8524f15c21ec93b9b2592da49b5460",
+            "name": "LICENSE-MIT",
+            "perms": 40960,
+            "status": "visible",
+            "length": 14,
+        },
+        {
+            "dir_id": "0000000000000000000000000000000000000001",
+            "type": "file",
+            "target": "76219eb72e8524f15c21ec93b9b2592da49b5460",
+            "name": "LICENSE-MIT-COPY",
+            "perms": 40960,
+            "status": "visible",
+            "length": 14,
+        },
+    ],
     "origin/https://github.com/rust-lang/rust/visits/": [
         {
             "origin": "https://github.com/rust-lang/rust",
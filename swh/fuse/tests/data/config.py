@@ -83,6 +83,33 @@ FAKE_SNP_SPECIAL_CASES = {
         "expected_symlink": "../heads/master",
     },
 }
+# Directory with a file entry of unknown length
+FAKE_DIR_NULL_LENGTH_SWHID = "swh:1:dir:0000000000000000000000000000000000000000"
+FAKE_DIR_NULL_LENGTH = [
+    {
+        "dir_id": remove_swhid_prefix(FAKE_DIR_NULL_LENGTH_SWHID),
+        "type": "file",
+        "target": remove_swhid_prefix(REGULAR_FILE),
+        "name": "README.md",
+        "perms": 33188,
+        "status": "visible",
+        "length": None,
+    },
+]
+# Directory with two symlinks sharing the same target (hence the same blob)
+FAKE_DIR_SAME_SYMLINKS_SWHID = "swh:1:dir:0000000000000000000000000000000000000001"
+FAKE_DIR_SAME_SYMLINKS = [
+    {
+        "dir_id": remove_swhid_prefix(FAKE_DIR_SAME_SYMLINKS_SWHID),
+        "type": "file",
+        "target": remove_swhid_prefix(CNT_SYMLINK),
+        "name": name,
+        "perms": 40960,
+        "status": "visible",
+        "length": 14,
+    }
+    for name in ("LICENSE-MIT", "LICENSE-MIT-COPY")
+]
 # Origin
 ORIGIN_URL = "https://github.com/rust-lang/rust"
 ORIGIN_URL_ENCODED = "https%3A%2F%2Fgithub.com%2Frust-lang%2Frust"
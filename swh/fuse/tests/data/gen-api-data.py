@@ -18,6 +18,10 @@ from swh.fuse.tests.api_url import (
 )
 from swh.fuse.tests.data.config import (
     ALL_ENTRIES,
+    FAKE_DIR_NULL_LENGTH,
+    FAKE_DIR_NULL_LENGTH_SWHID,
+    FAKE_DIR_SAME_SYMLINKS,
+    FAKE_DIR_SAME_SYMLINKS_SWHID,
     FAKE_SNP_SPECIAL_CASES,
     FAKE_SNP_SPECIAL_CASES_SWHID,
     ORIGIN_URL,
@@ -157,6 +161,12 @@ MOCK_ARCHIVE[swhid_to_web_url(FAKE_SNP_SPECIAL_CASES_SWHID)] = {
     "branches": FAKE_SNP_SPECIAL_CASES
 }
 
+# Custom fake directory with an entry of unknown length
+MOCK_ARCHIVE[swhid_to_web_url(FAKE_DIR_NULL_LENGTH_SWHID)] = FAKE_DIR_NULL_LENGTH
+
+# Custom fake directory with symlinks sharing the same blob
+MOCK_ARCHIVE[swhid_to_web_url(FAKE_DIR_SAME_SYMLINKS_SWHID)] = FAKE_DIR_SAME_SYMLINKS
+
 # Origin artifacts are not identified by SWHID but using an URL
 generate_origin_archive_web_api(ORIGIN_URL)
 
@@ -5,9 +5,10 @@
 
 import os
 
+from swh.fuse.cache import MetadataCache
 from swh.fuse.tests.data.config import REGULAR_FILE
 from swh.model.hashutil import hash_to_hex
-from swh.model.swhids import CoreSWHID
+from swh.model.swhids import CoreSWHID, ObjectType
 
 
 def test_cache_artifact(fuse_mntdir):
@@ -35,3 +36,20 @@ def test_purge_artifact(fuse_mntdir):
     os.unlink(fuse_mntdir / "cache" / hash_to_hex(swhid.object_id)[:2] / str(swhid))
 
     assert os.listdir(fuse_mntdir / "cache") == DEFAULT_CACHE_CONTENT
+
+
+def test_metadata_cached_subset(run_with_fuse):
+    # Span several batches to check the chunked queries
+    nb_swhids = 2 * MetadataCache.BATCH_SIZE + 1
+    swhids = [
+        CoreSWHID(object_type=ObjectType.CONTENT, object_id=i.to_bytes(20, "big"))
+        for i in range(nb_swhids)
+    ]
+    expected = set(swhids[::3])
+
+    async def get_cached_subset(fs):
+        for swhid in expected:
+            await fs.cache.metadata.set(swhid, {})
+        return await fs.cache.metadata.get_cached_subset(swhids)
+
+    assert run_with_fuse(get_cached_subset) == expected
@@ -1,5 +1,5 @@
 from swh.fuse.tests.common import get_data_from_web_archive
-from swh.fuse.tests.data.config import REGULAR_FILE
+from swh.fuse.tests.data.config import FAKE_DIR_NULL_LENGTH_SWHID, REGULAR_FILE
 
 
 def test_access_file(fuse_mntdir):
@@ -11,3 +11,10 @@ def test_cat_file(fuse_mntdir):
     file_path = fuse_mntdir / "archive" / REGULAR_FILE
     expected = get_data_from_web_archive(REGULAR_FILE, raw=True)
     assert file_path.read_text() == expected
+
+
+def test_unknown_length(fuse_mntdir):
+    # Without a length in the directory entry, fall back to the blob size
+    file_path = fuse_mntdir / "archive" / FAKE_DIR_NULL_LENGTH_SWHID / "README.md"
+    expected = get_data_from_web_archive(REGULAR_FILE, raw=True)
+    assert file_path.stat().st_size == len(expected.encode())
@@ -5,6 +5,7 @@ from swh.fuse.tests.data.config import (
     DIR_WITH_CNT_SYMLINK,
     DIR_WITH_DIR_SYMLINK,
     DIR_WITH_REV_SYMLINK,
+    FAKE_DIR_SAME_SYMLINKS_SWHID,
     ROOT_DIR,
 )
 
@@ -44,3 +45,15 @@ def test_access_symlinks(fuse_mntdir):
     for filename, swhid in submodules.items():
         target = f"../../archive/{swhid}"
         assert os.readlink(rev_sym_dir_path / filename) == target
+
+
+def test_access_symlinks_same_target(fuse_mntdir):
+    dir_path = fuse_mntdir / "archive" / FAKE_DIR_SAME_SYMLINKS_SWHID
+    assert os.readlink(dir_path / "LICENSE-MIT") == "../LICENSE-MIT"
+    assert os.readlink(dir_path / "LICENSE-MIT-COPY") == "../LICENSE-MIT"
+
+
+def test_link_count(fuse_mntdir):
+    dir_path = fuse_mntdir / "archive" / ROOT_DIR
+    assert os.stat(dir_path / "src").st_nlink == 2
+    assert os.stat(dir_path / "README.md").st_nlink == 1
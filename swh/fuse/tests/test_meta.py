@@ -1,7 +1,11 @@
+import asyncio
 import json
 
+from swh.fuse.tests.api_url import swhid_to_web_url
 from swh.fuse.tests.common import get_data_from_web_archive
-from swh.fuse.tests.data.config import ALL_ENTRIES
+from swh.fuse.tests.data.api_data import API_URL
+from swh.fuse.tests.data.config import ALL_ENTRIES, ROOT_REV
+from swh.model.swhids import CoreSWHID
 
 
 def test_access_meta_file(fuse_mntdir):
@@ -10,3 +14,18 @@ def test_access_meta_file(fuse_mntdir):
         file_path_meta = fuse_mntdir / f"archive/{swhid}.json"
         expected = json.dumps(get_data_from_web_archive(swhid))
         assert file_path_meta.read_text().strip() == expected.strip()
+
+
+def test_concurrent_metadata_requests(web_api_mock, run_with_fuse):
+    swhid = CoreSWHID.from_string(ROOT_REV)
+
+    async def get_metadata_concurrently(fs):
+        return await asyncio.gather(*(fs.get_metadata(swhid) for _ in range(10)))
+
+    results = run_with_fuse(get_metadata_concurrently)
+    assert all(metadata["id"] == swhid for metadata in results)
+
+    # Concurrent requests for the same SWHID are coalesced into one API call
+    url = f"{API_URL}/{swhid_to_web_url(swhid)}"
+    api_calls = [r for r in web_api_mock.request_history if r.url == url]
+    assert len(api_calls) == 1
@@ -1,16 +1,20 @@
+import asyncio
 import json
+import logging
 import os
 import time
 
 import dateutil.parser
 
+from swh.fuse import LOGGER_NAME
 from swh.fuse.fs.artifact import RevisionHistoryShardByDate, RevisionHistoryShardByPage
-from swh.fuse.tests.api_url import GRAPH_API_REQUEST
+from swh.fuse.tests.api_url import GRAPH_API_REQUEST, swhid_to_graph_url
 from swh.fuse.tests.common import (
     check_dir_name_entries,
     get_data_from_graph_archive,
     get_data_from_web_archive,
 )
+from swh.fuse.tests.data.api_data import API_URL
 from swh.fuse.tests.data.config import REV_SMALL_HISTORY, ROOT_DIR, ROOT_REV
 from swh.model.hashutil import hash_to_hex
 from swh.model.swhids import CoreSWHID
@@ -90,3 +94,53 @@ def test_list_history(fuse_mntdir):
         depth2 = str(swhid)
         assert (dir_by_date / depth1).exists()
         assert depth2 in (os.listdir(dir_by_date / depth1))
+
+
+def test_get_history_page(web_api_mock, run_with_fuse):
+    swhid = CoreSWHID.from_string(REV_SMALL_HISTORY)
+
+    async def get_pages(fs):
+        # History not cached yet
+        first_page = await fs.get_history_page(swhid, offset=2, limit=5)
+        # History already cached
+        second_page = await fs.get_history_page(swhid, offset=7, limit=5)
+        out_of_range = await fs.get_history_page(swhid, offset=1000, limit=5)
+        history = await fs.get_history(swhid)
+        return first_page, second_page, out_of_range, history
+
+    first_page, second_page, out_of_range, history = run_with_fuse(get_pages)
+    assert first_page == history[2:7]
+    assert second_page == history[7:12]
+    assert out_of_range == []
+
+    graph_url = f"{API_URL}/{swhid_to_graph_url(swhid, GRAPH_API_REQUEST.HISTORY)}"
+    graph_calls = [
+        r for r in web_api_mock.request_history if r.url.startswith(graph_url)
+    ]
+    assert len(graph_calls) == 1
+
+
+def test_background_tasks(run_with_fuse, caplog):
+    caplog.set_level(logging.ERROR, logger=LOGGER_NAME)
+
+    async def run_background_tasks(fs):
+        async def fail():
+            raise ValueError("prefetch failed")
+
+        sleeping = fs.create_background_task(asyncio.sleep(3600))
+        failing = fs.create_background_task(fail())
+        await asyncio.wait([failing])
+        # Failed tasks are no longer tracked
+        assert fs.background_tasks == {sleeping}
+
+        # Remaining tasks are cancelled and awaited on shutdown
+        await fs.shutdown()
+        assert sleeping.cancelled()
+        assert fs.background_tasks == set()
+
+    run_with_fuse(run_background_tasks)
+
+    errors = [r for r in caplog.records if r.levelno == logging.ERROR]
+    assert len(errors) == 1
+    assert "Background task failed" in errors[0].getMessage()
+    assert errors[0].exc_info[0] is ValueError